@@ -0,0 +1,182 @@
+"""Local stand-in for the Telegram Bot API used by the load test.
+
+It understands just enough of the API for bot.py: ``getMe``, ``getUpdates``
+(with long polling), ``setWebhook``/``deleteWebhook``, ``sendMessage``,
+``editMessageText`` and ``answerCallbackQuery``. Every call can be delayed
+and a share of the replies can fail with a flood-control or server error.
+"""
+import json
+import time
+import random
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Calls that may fail on purpose; startup calls always succeed
+FALLIBLE_METHODS = {'sendMessage', 'editMessageText', 'answerCallbackQuery'}
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Load test', 'username': 'loadtest_bot'}
+
+
+class FakeBotApi:
+    """Bot API server that queues injected updates and records the bot's replies."""
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.webhook_url = ''
+        self.replies = []
+        self.calls = {}
+        self.errors = 0
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._lock = threading.Lock()
+        self._arrived = threading.Condition(self._lock)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        """Value for the bot's BOT_API_URL."""
+        return f"http://127.0.0.1:{self.server.server_port}/bot"
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        """Build an update with a private text message, as a user would send it."""
+        with self._lock:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+        message = {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': f"user{user_id}"},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [
+                {'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}
+            ]
+        return {'update_id': update_id, 'message': message}
+
+    def inject(self, update: dict) -> None:
+        """Deliver an update: queue it for getUpdates or post it to the webhook."""
+        if self.webhook_url:
+            request = urllib.request.Request(
+                self.webhook_url,
+                data=json.dumps(update).encode(),
+                headers={'Content-Type': 'application/json'}
+            )
+            urllib.request.urlopen(request, timeout=10).read()
+            return
+        with self._arrived:
+            self._updates.append(update)
+            self._arrived.notify_all()
+
+    # Bot API methods
+
+    def _get_updates(self, params: dict):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._arrived:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._arrived.wait(deadline - time.monotonic())
+            return self._updates[:limit]
+
+    def _send_message(self, params: dict):
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            self.replies.append((int(params['chat_id']), time.monotonic()))
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params['chat_id']), 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    def _set_webhook(self, params: dict):
+        self._drop_pending(params)
+        self.webhook_url = params.get('url', '')
+        return True
+
+    def _delete_webhook(self, params: dict):
+        self._drop_pending(params)
+        self.webhook_url = ''
+        return True
+
+    def _drop_pending(self, params: dict) -> None:
+        if params.get('drop_pending_updates'):
+            with self._lock:
+                self._updates = []
+
+    def call(self, method: str, params: dict) -> dict:
+        """Answer one Bot API call with the JSON body Telegram would send."""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method != 'getUpdates':
+            if self.latency or self.jitter:
+                time.sleep(self.latency + self.random.uniform(0, self.jitter))
+            if method in FALLIBLE_METHODS and self.random.random() < self.error_rate:
+                with self._lock:
+                    self.errors += 1
+                if self.random.random() < 0.5:
+                    return {
+                        'ok': False, 'error_code': 429,
+                        'description': 'Too Many Requests: retry after 1',
+                        'parameters': {'retry_after': 1},
+                    }
+                return {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+
+        handlers = {
+            'getMe': lambda params: BOT_USER,
+            'getUpdates': self._get_updates,
+            'setWebhook': self._set_webhook,
+            'deleteWebhook': self._delete_webhook,
+            'sendMessage': self._send_message,
+            'editMessageText': self._send_message,
+        }
+        handler = handlers.get(method, lambda params: True)
+        return {'ok': True, 'result': handler(params)}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; avoid Nagle/delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                try:
+                    params = json.loads(body) if body else {}
+                except ValueError:
+                    params = {}
+                method = self.path.rsplit('/', 1)[-1]
+                answer = api.call(method, params)
+                payload = json.dumps(answer).encode()
+                self.send_response(answer.get('error_code', 200))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
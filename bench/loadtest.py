@@ -0,0 +1,216 @@
+"""Offline load test for bot.py.
+
+Starts the bot as a subprocess pointed at a local fake Bot API, replays
+synthetic traffic (the menu buttons and /start) at a fixed rate from a
+pool of users and reports throughput, end-to-end latency and memory.
+
+    python -m bench.loadtest --rate 100 --users 500 --duration 30
+    python -m bench.loadtest --mode webhook --save baseline.json
+    python -m bench.loadtest --baseline baseline.json
+
+Latency is measured from the moment an update is handed to the bot (queued
+for getUpdates or posted to the webhook) until the fake API receives the
+reply. Run it from the repository root.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import signal
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import load_catalog
+from bench.fake_bot_api import FakeBotApi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = '123456:LOADTEST-fake-token-for-local-runs'
+# Metrics compared against a baseline and whether lower is better
+COMPARED = {
+    'throughput_per_s': False,
+    'latency_p50_ms': True,
+    'latency_p95_ms': True,
+    'latency_p99_ms': True,
+    'rss_peak_mb': True,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, share: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def memory_mb(pid: int, field: str) -> float:
+    """Read a memory figure of a process from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def start_bot(api: FakeBotApi, mode: str, port: int, data_dir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN': TOKEN,
+        'BOT_API_URL': api.base_url,
+        'BOT_MODE': mode,
+        'PORT': str(port),
+        'WEBHOOK_URL': f"http://127.0.0.1:{port}",
+        'DB_PATH': os.path.join(data_dir, 'bot.sqlite3'),
+        'CONTENT_RELOAD_INTERVAL': '0',
+    })
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'bot.py')],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+
+def wait_ready(bot: subprocess.Popen, api: FakeBotApi, mode: str, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if bot.poll() is not None:
+            raise RuntimeError(f"bot exited during startup:\n{bot.stderr.read().decode()}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1) as response:
+                if response.status == 200 and (mode != 'webhook' or api.webhook_url):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("bot did not become ready")
+
+
+def run(args) -> dict:
+    catalog = load_catalog(os.path.join(ROOT, 'content.json'))
+    texts = list(catalog.routes) + ['/start']
+    rng = random.Random(args.seed)
+
+    api = FakeBotApi(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     seed=args.seed)
+    api.start()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        bot = start_bot(api, args.mode, port, data_dir)
+        try:
+            wait_ready(bot, api, args.mode, port)
+            rss_idle = memory_mb(bot.pid, 'VmRSS')
+
+            sent = {}
+            total = int(args.rate * args.duration)
+            pool = ThreadPoolExecutor(max_workers=32)
+            started = time.monotonic()
+            for number in range(total):
+                delay = started + number / args.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                user_id = 1000 + rng.randrange(args.users)
+                update = api.message_update(user_id, rng.choice(texts))
+                sent.setdefault(user_id, []).append(time.monotonic())
+                if args.mode == 'webhook':
+                    pool.submit(api.inject, update)
+                else:
+                    api.inject(update)
+            injected = time.monotonic()
+            pool.shutdown(wait=True)
+
+            deadline = time.monotonic() + args.drain
+            while len(api.replies) < total and time.monotonic() < deadline:
+                time.sleep(0.05)
+            rss_peak = memory_mb(bot.pid, 'VmHWM')
+        finally:
+            bot.send_signal(signal.SIGTERM)
+            try:
+                bot.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+            api.stop()
+
+    # Replies within a chat keep the order of the updates, so match them first-in first-out
+    latencies = []
+    pending = {user_id: list(times) for user_id, times in sent.items()}
+    last_reply = started
+    for chat_id, replied in sorted(api.replies, key=lambda reply: reply[1]):
+        times = pending.get(chat_id)
+        if times:
+            latencies.append(replied - times.pop(0))
+            last_reply = max(last_reply, replied)
+    latencies.sort()
+
+    return {
+        'mode': args.mode,
+        'rate': args.rate,
+        'users': args.users,
+        'duration': args.duration,
+        'latency_injected_ms': args.latency * 1000,
+        'error_rate': args.error_rate,
+        'updates': total,
+        'answered': len(latencies),
+        'unanswered': total - len(latencies),
+        'injected_errors': api.errors,
+        'inject_seconds': round(injected - started, 2),
+        'throughput_per_s': round(len(latencies) / max(last_reply - started, 1e-9), 1),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'rss_idle_mb': round(rss_idle, 1),
+        'rss_peak_mb': round(rss_peak, 1),
+        'api_calls': api.calls,
+    }
+
+
+def report(result: dict, baseline: dict = None) -> None:
+    for key, value in result.items():
+        line = f"{key:>22}: {value}"
+        if baseline and key in COMPARED and baseline.get(key):
+            change = (value - baseline[key]) / baseline[key] * 100
+            better = (change < 0) == COMPARED[key]
+            line += f"  ({change:+.1f}% vs baseline {baseline[key]}, {'better' if better else 'worse'})"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    parser.add_argument('--rate', type=float, default=50, help='updates per second')
+    parser.add_argument('--users', type=int, default=200, help='distinct users sending updates')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of traffic')
+    parser.add_argument('--latency', type=float, default=0.05, help='Bot API latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='extra random latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of replies failing with 429 or 500')
+    parser.add_argument('--drain', type=float, default=15, help='seconds to wait for late replies')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the result to this JSON file')
+    parser.add_argument('--baseline', help='compare with a result saved earlier')
+    args = parser.parse_args()
+
+    result = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,30 @@
 import os
 import logging
+import time
+import functools
+import signal
+from collections import deque
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, ReplyKeyboardMarkup
+from telegram import Update
 from telegram.ext import (
     Updater,
+    ExtBot,
     CommandHandler,
     CallbackQueryHandler,
     CallbackContext,
     MessageHandler,
+    TypeHandler,
+    InlineQueryHandler,
     Filters
 )
-from telegram.error import TelegramError
+from telegram.error import TelegramError, BadRequest, RetryAfter
+from catalog import CatalogStore, MENU_VIEW, validate_markdown_v2
+from broadcast import RateLimiter, Broadcaster
+from persistence import SqlitePersistence
+from metrics import Registry, Counter, Histogram, Gauge, Throughput, InstrumentedRequest
 import threading
 from http.server import HTTPServer, BaseHTTPRequestHandler
+import tornado.web
 
 # Configure logging
 logging.basicConfig(
@@ -24,130 +36,118 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Constants
-SOCIAL_MEDIA = (
-    "🧭 Наш сайт: http://prostogovorite\\.com\n"
-    "📢 ТГ Канал: @prostogovoritech\n"
-    "💬 Чат поддержки: @psysrb\n"
-    "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-    "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t.me/psysrbcom)\n\n"
-)
+# Bot API endpoint; point it at a local Bot API server or the load-test stand-in
+BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org/bot')
+# Serving mode: "polling" (default) or "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Public HTTPS base URL Telegram should deliver updates to, e.g. https://bot.up.railway.app
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+# Secret path segment of the webhook; defaults to the bot token
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '')
+# Handler threads; 0 handles updates one at a time on the dispatcher thread
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '8'))
+# Telegram user ids allowed to run /broadcast, comma-separated
+ADMIN_IDS = [int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()]
+# Messages per second across replies and broadcasts; kept below Telegram's ~30/s
+SEND_RATE = float(os.getenv('SEND_RATE', '25'))
+# Threads sending a broadcast in parallel
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '4'))
+# SQLite database with users, their last activity and per-user data
+DB_PATH = os.getenv('DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.sqlite3'))
+# How often buffered writes are committed to the database, in seconds
+DB_FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '1'))
+# HTTP connections to the Bot API shared by handlers, broadcasts, the dispatcher and the poller
+CON_POOL_SIZE = int(os.getenv('CON_POOL_SIZE', str(DISPATCH_WORKERS + BROADCAST_WORKERS + 8)))
+# Content catalog with all texts and menu sections
+CONTENT_PATH = os.getenv('CONTENT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content.json'))
+# How often the catalog file is checked for changes, in seconds; 0 disables reloading
+CONTENT_RELOAD_INTERVAL = float(os.getenv('CONTENT_RELOAD_INTERVAL', '30'))
+# Backlog left from downtime: "coalesce" (default) answers only the latest request per chat,
+# "drop" discards it, "off" answers every pending update
+CATCHUP_MODE = os.getenv('CATCHUP_MODE', 'coalesce').lower()
+# Presses of one chat closer together than this many seconds are collapsed into the latest
+CATCHUP_WINDOW = float(os.getenv('CATCHUP_WINDOW', '60'))
+# Most updates and seconds spent fetching the backlog; anything left is answered update by update
+CATCHUP_LIMIT = int(os.getenv('CATCHUP_LIMIT', '10000'))
+CATCHUP_TIMEOUT = float(os.getenv('CATCHUP_TIMEOUT', '10'))
+# Menu style: "reply" (default) sends a new message per button from the reply keyboard,
+# "inline" switches sections by editing one message through inline buttons
+NAVIGATION = os.getenv('NAVIGATION', 'reply').lower()
+# Seconds Telegram clients may cache a callback answer. Cached taps never reach the bot, so
+# returning to a section already opened from the same message would not switch it; keep 0
+# unless the menu is one level deep
+CALLBACK_CACHE_TIME = int(os.getenv('CALLBACK_CACHE_TIME', '0'))
+# Seconds Telegram caches inline query results on its servers
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+# Seconds a SIGTERM waits for queued updates to be answered before the process exits
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '8'))
+# Railway injects PORT; health endpoints are served on it in both modes
+PORT = int(os.getenv('PORT', '8080'))
 
-RESPONSES = {
-    'help': (
-        "*Бесплатная психологическая помощь*\n\n"
-        "До 10 сессий с проверенным специалистом\\. Подходит тем, кто испытывает финансовые трудности\\.\n\n"
-        "→ Напишите координатору: @kondrashkin\\_pro\n\n"
-        "*Также доступна поддержка от специально обученных волонтёров:*\n"
-        "→ Написать: @pgprobono\n\n"
-        "Помощь оказывается конфиденциально\n\n"
-        "\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\n\n"
-        "*Присоединяйтесь к Просто Говорить\\!*\n\n"
-        "🧭 Наш сайт: http://prostogovorite\\.com\n"
-        "📢 ТГ Канал: @prostogovoritech\n"
-        "💬 Чат поддержки: @psysrb\n"
-        "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-        "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t\\.me/psysrbcom)"
-    ),
-    'find_psy': (
-        "*Подбор психолога*\n\n"
-        "Ищете специалиста, который подойдёт именно вам? "
-        "Наш бот поможет подобрать психолога, учитывая ваш запрос, язык общения и другие важные параметры\\. "
-        "Это конфиденциально\\.\n\n"
-        "🤖 *Начать подбор через специализированного бота:*\n"
-        "→ @PsyGovoritBOT\n\n"
-        "🔍 *Также вы можете посмотреть каталог специалистов на нашем сайте:*\n"
-        "→ prostogovorite\\.com\n\n"
-        "\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\n\n"
-        "*Присоединяйтесь к Просто Говорить\\!*\n\n"
-        "🧭 Наш сайт: http://prostogovorite\\.com\n"
-        "📢 ТГ Канал: @prostogovoritech\n"
-        "💬 Чат поддержки: @psysrb\n"
-        "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-        "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t\\.me/psysrbcom)"
-    ),
-    'support_group': (
-        "*Группы поддержки*\n\n"
-        "Проводим онлайн и офлайн встречи в Сербии, где можно безопасно делиться и чувствовать поддержку\\.\n\n"
-        "• *Открытые группы поддержки*\n"
-        "Проходят регулярно\\. Уютная атмосфера, ведущие — опытные фасилитаторы\\.\n"
-        "Чтобы узнать о ближайших встречах, напишите в [@prostogovorite](https://t\\.me/prostogovorite)\n\n"
-        "Иногда важно просто быть рядом с другими 🫂\n\n"
-        "\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\n\n"
-        "*Присоединяйтесь к Просто Говорить\\!*\n\n"
-        "🧭 Наш сайт: http://prostogovorite\\.com\n"
-        "📢 ТГ Канал: @prostogovoritech\n"
-        "💬 Чат поддержки: @psysrb\n"
-        "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-        "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t\\.me/psysrbcom)"
-    ),
-    'announce': (
-        "*Мероприятия и события*\n\n"
-        "• *Онлайн\\-события и воркшопы*\n"
-        "Тематические мероприятия для саморазвития и общения\n"
-        "→ Следите за анонсами: @prostogovoritech\n\n"
-        "• *Вебинары*\n"
-        "Записи доступны на нашем YouTube канале\n"
-        "📺 [YouTube плейлист](https://www\\.youtube\\.com/playlist?list=PLwX15bk1TAv0Se4DFOY9L31Tu8FEWdRuR&si=URNsGOFqyQOwdvJ\\-)\n\n"
-        "\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\n\n"
-        "*Присоединяйтесь к Просто Говорить\\!*\n\n"
-        "🧭 Наш сайт: http://prostogovorite\\.com\n"
-        "📢 ТГ Канал: @prostogovoritech\n"
-        "💬 Чат поддержки: @psysrb\n"
-        "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-        "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t\\.me/psysrbcom)"
-    ),
-    'hotline': (
-        "*Телефон доверия*\n\n"
-        "🤝 *Поддержка от специально обученных волонтёров:*\n"
-        "• Анонимно\n"
-        "• Без осуждения\n"
-        "• В формате чата\n\n"
-        "→ Написать в телефон доверия: @pgprobono\n\n"
-        "👥 Чат поддержки: @psysrb\n"
-        "🤖 Бот для отправки анонимных сообщений в чат поддержки: [@anonymous_psysrb_bot](https://t\\.me/anonymous_psysrb_bot)\n\n"
-        "\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\\-\n\n"
-        "*Присоединяйтесь к Просто Говорить\\!*\n\n"
-        "🧭 Наш сайт: http://prostogovorite\\.com\n"
-        "📢 ТГ Канал: @prostogovoritech\n"
-        "💬 Чат поддержки: @psysrb\n"
-        "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-        "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t\\.me/psysrbcom)"
-    )
-}
-
-def get_keyboard():
-    """Create the keyboard with uniform width buttons."""
-    keyboard = [
-        ["🤝 Получить бесплатную психологическую помощь"],
-        ["👤 Подобрать специалиста"],
-        ["👥 Группа поддержки"],
-        ["📅 Узнать про мероприятия"],
-        ["☎️ Телефон доверия"]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-def get_welcome_message():
-    """Create the welcome message with project information."""
-    return (
-        "Привет\\! Я бот проекта «Просто говорить»\\.\n\n"
-        "Выберите нужный вам раздел\\.\n\n"
-        "*О нашем проекте:*\n"
-        "🧭 Наш сайт: http://prostogovorite\\.com\n"
-        "📢 ТГ Канал: @prostogovoritech — новости, анонсы\n"
-        "💬 Чат поддержки: @psysrb — общение\n"
-        "📸 Instagram: [@prostogovorite](https://instagram\\.com/prostogovorite)\n"
-        "👥 Коммьюнити психологов в Сербии: [@psysrbcom](https://t\\.me/psysrbcom)"
-    )
+# Loaded and validated at startup; a broken catalog stops the bot before it sends anything
+CONTENT = CatalogStore(CONTENT_PATH)
+
+# Replies and broadcasts share one budget of outbound messages; replies go first
+LIMITER = RateLimiter(SEND_RATE)
+BROADCASTER = Broadcaster(LIMITER, workers=BROADCAST_WORKERS)
+
+# Metrics exposed in Prometheus format on /metrics
+METRICS = Registry()
+UPDATES_TOTAL = Counter(METRICS, 'bot_updates_total', 'Updates received')
+COMMANDS_TOTAL = Counter(METRICS, 'bot_commands_total', 'Commands received', 'command')
+BUTTONS_TOTAL = Counter(METRICS, 'bot_button_presses_total', 'Menu button presses', 'section')
+INLINE_QUERIES_TOTAL = Counter(METRICS, 'bot_inline_queries_total', 'Inline queries answered')
+ERRORS_TOTAL = Counter(METRICS, 'bot_errors_total', 'Errors by exception class', 'error')
+HANDLER_SECONDS = Histogram(METRICS, 'bot_handler_seconds', 'Time spent in handlers', 'handler')
+API_SECONDS = Histogram(METRICS, 'bot_telegram_api_seconds', 'Duration of Bot API calls', 'method')
+THROUGHPUT = Throughput()
+Gauge(METRICS, 'bot_updates_per_second', 'Updates received per second over the last 10s', THROUGHPUT.rate)
+# Anything else is counted as "other" to keep the label set bounded
+KNOWN_COMMANDS = {'start', 'broadcast'}
+
+def count_update(update: Update, context: CallbackContext) -> None:
+    """Count every incoming update and the commands among them."""
+    UPDATES_TOTAL.inc()
+    THROUGHPUT.mark()
+    message = update.effective_message
+    if message is not None and message.text and message.text.startswith('/'):
+        command = message.text.split(maxsplit=1)[0][1:].split('@', 1)[0]
+        COMMANDS_TOTAL.inc(command if command in KNOWN_COMMANDS else 'other')
+
+def timed(callback):
+    """Record how long a handler callback takes."""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    def run(update: Update, context: CallbackContext) -> None:
+        started = time.perf_counter()
+        try:
+            return callback(update, context)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+    return run
+
+def send(chat_id: int, method, *args, **kwargs):
+    """Send a reply within the shared rate limit, retrying once after a flood warning."""
+    LIMITER.take(chat_id)
+    try:
+        return method(*args, **kwargs)
+    except RetryAfter as e:
+        logger.warning(f"Flood limit hit, pausing outbound messages for {e.retry_after}s")
+        LIMITER.pause(e.retry_after)
+        LIMITER.take(chat_id)
+        return method(*args, **kwargs)
 
 def error_handler(update: Update, context: CallbackContext) -> None:
     """Log the error and send a message to the user."""
     logger.error(f"Error: {context.error}")
+    ERRORS_TOTAL.inc(type(context.error).__name__)
     try:
-        if update.callback_query:
-            update.callback_query.message.reply_text(
+        if isinstance(update, Update) and update.callback_query:
+            send(
+                update.effective_chat.id, update.callback_query.message.reply_text,
                 "Произошла ошибка\\. Пожалуйста, попробуйте снова или используйте команду /start",
-                reply_markup=get_keyboard()
+                reply_markup=CONTENT.current.keyboard_markup
             )
     except Exception as e:
         logger.error(f"Error in error handler: {e}")
@@ -155,20 +155,23 @@ def error_handler(update: Update, context: CallbackContext) -> None:
 def start(update: Update, context: CallbackContext) -> None:
     """Send a message with keyboard when the command /start is issued."""
     try:
-        update.message.reply_text(
-            get_welcome_message(),
-            reply_markup=get_keyboard(),
-            parse_mode=ParseMode.MARKDOWN_V2,
-            disable_web_page_preview=True
+        catalog = CONTENT.current
+        send(
+            update.effective_chat.id, update.message.reply_text,
+            **(catalog.inline_start_reply if NAVIGATION == 'inline' else catalog.start_reply)
         )
     except TelegramError as e:
         logger.error(f"Telegram Error in start command: {e}")
-        update.message.reply_text(
+        ERRORS_TOTAL.inc(type(e).__name__)
+        send(
+            update.effective_chat.id, update.message.reply_text,
             "Произошла ошибка при отправке сообщения\\. Пожалуйста, попробуйте снова: /start"
         )
     except Exception as e:
         logger.error(f"Error in start command: {e}")
-        update.message.reply_text(
+        ERRORS_TOTAL.inc(type(e).__name__)
+        send(
+            update.effective_chat.id, update.message.reply_text,
             "Произошла ошибка\\. Пожалуйста, попробуйте позже или обратитесь к администратору\\."
         )
 
@@ -176,47 +179,433 @@ def message_handler(update: Update, context: CallbackContext) -> None:
     """Handle button presses."""
     try:
         text = update.message.text
-        response = None
-        
-        if text == "🤝 Получить бесплатную психологическую помощь":
-            response = RESPONSES['help']
-        elif text == "👤 Подобрать специалиста":
-            response = RESPONSES['find_psy']
-        elif text == "👥 Группа поддержки":
-            response = RESPONSES['support_group']
-        elif text == "📅 Узнать про мероприятия":
-            response = RESPONSES['announce']
-        elif text == "☎️ Телефон доверия":
-            response = RESPONSES['hotline']
-        
-        if response:
-            update.message.reply_text(
-                text=response,
-                reply_markup=get_keyboard(),
-                parse_mode=ParseMode.MARKDOWN_V2,
-                disable_web_page_preview=True
-            )
+        catalog = CONTENT.current
+        reply = catalog.routes.get(text)
+
+        if reply:
+            BUTTONS_TOTAL.inc(catalog.buttons[text])
+            send(update.effective_chat.id, update.message.reply_text, **reply)
             logger.info(f"User {update.effective_user.id} pressed button: {text}")
         
     except TelegramError as e:
         logger.error(f"Telegram Error in message handler: {e}")
+        ERRORS_TOTAL.inc(type(e).__name__)
         try:
-            update.message.reply_text(
+            send(
+                update.effective_chat.id, update.message.reply_text,
                 "Произошла ошибка при отправке сообщения\\. Пожалуйста, используйте /start",
-                reply_markup=get_keyboard()
+                reply_markup=CONTENT.current.keyboard_markup
             )
         except:
             pass
     except Exception as e:
         logger.error(f"Error in message handler: {e}")
+        ERRORS_TOTAL.inc(type(e).__name__)
         try:
-            update.message.reply_text(
+            send(
+                update.effective_chat.id, update.message.reply_text,
                 "Произошла ошибка\\. Пожалуйста, попробуйте позже или обратитесь к администратору\\.",
-                reply_markup=get_keyboard()
+                reply_markup=CONTENT.current.keyboard_markup
             )
         except:
             pass
 
+def navigation_handler(update: Update, context: CallbackContext) -> None:
+    """Switch the inline menu to the chosen section by editing the message in place."""
+    query = update.callback_query
+    view = CONTENT.current.views.get(query.data)
+    if view is None:
+        # A button of a section removed from the catalog since the message was sent
+        answer_callback(query, "Этот раздел больше недоступен, отправьте /start")
+        return
+    answer_callback(query, cache_time=CALLBACK_CACHE_TIME)
+    if query.data != MENU_VIEW:
+        BUTTONS_TOTAL.inc(query.data)
+
+    try:
+        send(update.effective_chat.id, query.edit_message_text, **view)
+    except BadRequest as e:
+        # A repeated tap on the button of the section already shown
+        if 'not modified' not in e.message:
+            raise
+
+def answer_callback(query, text: str = None, cache_time: int = None) -> None:
+    """Stop the button's loading indicator; a failed answer must not cancel the reply."""
+    try:
+        query.answer(text, cache_time=cache_time)
+    except BadRequest as e:
+        # Taps left from downtime are "too old" to answer but can still be handled
+        logger.info(f"Callback query {query.id} not answered: {e}")
+
+def inline_query_handler(update: Update, context: CallbackContext) -> None:
+    """Answer an inline query from the prebuilt index of catalog sections."""
+    query = update.inline_query
+    INLINE_QUERIES_TOTAL.inc()
+    query.answer(
+        CONTENT.current.search(query.query.strip()),
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=False
+    )
+
+def broadcast_command(update: Update, context: CallbackContext) -> None:
+    """Send the text after /broadcast to every user of the bot."""
+    # text_markdown_v2 keeps the formatting the admin applied in their client
+    parts = update.message.text_markdown_v2.split(maxsplit=1)
+    if len(parts) < 2:
+        update.message.reply_text("Использование: /broadcast <текст анонса>")
+        return
+    text = parts[1]
+    try:
+        validate_markdown_v2(text)
+    except ValueError as e:
+        update.message.reply_text(f"Анонс не отправлен, ошибка разметки: {e}")
+        return
+    if BROADCASTER.busy:
+        update.message.reply_text("Рассылка уже идёт, дождитесь её окончания.")
+        return
+
+    chat_ids = context.dispatcher.persistence.chat_ids()
+    update.message.reply_text(f"Начинаю рассылку на {len(chat_ids)} пользователей.")
+    logger.info(f"User {update.effective_user.id} started a broadcast to {len(chat_ids)} chats")
+
+    def run() -> None:
+        try:
+            result = BROADCASTER.broadcast(context.bot, chat_ids, text, on_blocked=context.dispatcher.persistence.mark_blocked)
+        except Exception as e:
+            logger.error(f"Broadcast failed: {e}")
+            update.message.reply_text(f"Рассылка прервана: {e}")
+            return
+        logger.info(f"Broadcast finished: {result}")
+        update.message.reply_text(
+            f"Рассылка завершена за {result.elapsed:.0f} с: отправлено {result.sent}, "
+            f"заблокировали бота {result.blocked}, ошибок {result.failed}."
+        )
+
+    threading.Thread(target=run, name="broadcast", daemon=True).start()
+
+class DeliveryStats:
+    """Collect how long updates take to reach the bot.
+
+    The lag is measured against ``message.date``, which Telegram stamps with
+    one-second resolution, so single samples are coarse; the mean over the
+    window is what makes polling and webhook delivery comparable.
+    """
+
+    def __init__(self, mode: str, window: int = 1000):
+        self.mode = mode
+        self._samples = deque(maxlen=window)
+        self._skipped = set()
+        self._lock = threading.Lock()
+
+    def skip(self, update_ids) -> None:
+        """Leave updates out of the statistics, e.g. a backlog that waited out a restart."""
+        with self._lock:
+            self._skipped.update(update_ids)
+
+    def record(self, update: Update, context: CallbackContext) -> None:
+        """Record the delivery lag of an incoming update."""
+        if self._skipped and update.update_id in self._skipped:
+            with self._lock:
+                self._skipped.discard(update.update_id)
+            return
+        # Callback queries carry the date of the message with the buttons and edits the
+        # date of the original message, not when the update was sent
+        message = update.message or update.channel_post
+        if message is None or message.date is None:
+            return
+        lag = time.time() - message.date.timestamp()
+        with self._lock:
+            self._samples.append(lag)
+
+    def mean_lag(self) -> float:
+        """Return the mean delivery lag in seconds."""
+        with self._lock:
+            samples = list(self._samples)
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def summary(self) -> str:
+        """Return the delivery lag summary as a single line."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return f"mode={self.mode} samples=0"
+        mean = sum(samples) / len(samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return (
+            f"mode={self.mode} samples={len(samples)} "
+            f"lag_mean_ms={mean * 1000:.0f} lag_p95_ms={p95 * 1000:.0f}"
+        )
+
+
+class ChatOrderedExecutor:
+    """Run handlers on a thread pool while keeping each chat in order.
+
+    Every chat has its own queue. An idle worker takes the next chat that
+    has updates waiting and none in progress, so replies within a chat
+    follow the order of incoming updates while a slow reply holds up only
+    its own chat.
+    """
+
+    def __init__(self, workers: int, timings: Histogram = None):
+        self.workers = workers
+        self.timings = timings
+        # Chats with updates waiting or in progress; a chat is listed in _ready
+        # only while none of its updates is being handled
+        self._chats = {}
+        self._ready = deque()
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        for number in range(workers):
+            threading.Thread(target=self._work, name=f"chat-worker-{number}", daemon=True).start()
+
+    def wrap(self, callback):
+        """Turn a handler callback into one that is queued behind its chat's earlier updates."""
+        @functools.wraps(callback)
+        def submit(update: Update, context: CallbackContext) -> None:
+            # Inline queries have no chat; keep them in order per user instead
+            sender = update.effective_chat or update.effective_user
+            key = sender.id if sender else 0
+            with self._available:
+                self._waiting += 1
+                queue = self._chats.get(key)
+                if queue is not None:
+                    queue.append((callback, update, context))
+                    return
+                self._chats[key] = deque([(callback, update, context)])
+                self._ready.append(key)
+                self._available.notify()
+        return submit
+
+    def _work(self) -> None:
+        while True:
+            with self._available:
+                while not self._ready:
+                    self._available.wait()
+                key = self._ready.popleft()
+                callback, update, context = self._chats[key].popleft()
+                self._waiting -= 1
+            try:
+                callback(update, context)
+                # The dispatcher saved this update's data before the handler ran
+                context.dispatcher.update_persistence(update)
+            except Exception as e:
+                context.dispatcher.dispatch_error(update, e)
+            finally:
+                with self._available:
+                    if self._chats[key]:
+                        self._ready.append(key)
+                        self._available.notify()
+                    else:
+                        del self._chats[key]
+                        if not self._chats:
+                            self._idle.notify_all()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait until every queued update has been handled; return False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._chats, timeout)
+
+    def queue_depth(self) -> int:
+        """Return the number of updates waiting for a worker."""
+        return self._waiting
+
+    def unfinished(self) -> int:
+        """Return the number of updates waiting for a worker or being handled."""
+        with self._lock:
+            # A chat that is not ready has one update in progress
+            return self._waiting + len(self._chats) - len(self._ready)
+
+    def summary(self) -> str:
+        """Return queue depth and per-handler timings as a single line."""
+        totals = self.timings.totals() if self.timings else {}
+        timings = " ".join(
+            f"{name}_count={count} {name}_avg_ms={total / count * 1000:.0f}"
+            for name, (count, total) in totals.items() if count
+        )
+        return f"workers={self.workers} queue_depth={self.queue_depth()} {timings}".rstrip()
+
+
+class HealthCheck:
+    """Answer liveness and readiness probes for the running updater."""
+
+    def __init__(self, updater: Updater, stats: DeliveryStats, executor: ChatOrderedExecutor = None,
+                 metrics: Registry = None):
+        self.updater = updater
+        self.stats = stats
+        self.executor = executor
+        self.metrics = metrics
+
+    def probe(self, path: str):
+        """Return the HTTP status and body for a probe path."""
+        if path in ('/', '/healthz'):
+            return 200, "OK"
+        if path == '/readyz':
+            if self.updater.running and self.updater.dispatcher.running:
+                report = self.stats.summary()
+                if self.executor:
+                    report += f" {self.executor.summary()}"
+                return 200, f"READY {report}"
+            return 503, "NOT READY"
+        if path == '/metrics' and self.metrics:
+            return 200, self.metrics.render()
+        return 404, "Not Found"
+
+
+class TornadoHealthHandler(tornado.web.RequestHandler):
+    """Serve health probes from the webhook server."""
+
+    def initialize(self, health: HealthCheck) -> None:
+        self.health = health
+
+    def get(self, *args) -> None:
+        status, body = self.health.probe(self.request.path)
+        self.set_status(status)
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        self.write(body)
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Serve health probes in polling mode."""
+
+    health = None
+
+    def do_GET(self):
+        status, body = self.health.probe(self.path)
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_health_server(health: HealthCheck) -> None:
+    """Serve health probes on PORT in a background thread."""
+    HealthHandler.health = health
+    server = HTTPServer(('0.0.0.0', PORT), HealthHandler)
+    threading.Thread(target=server.serve_forever, name="health", daemon=True).start()
+
+
+def start_webhook(updater: Updater, bot_token: str, health: HealthCheck,
+                  drop_pending_updates: bool = False) -> None:
+    """Receive updates via webhook and serve health probes on the same port."""
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL is required when BOT_MODE=webhook")
+    url_path = WEBHOOK_PATH or bot_token
+    updater.start_webhook(
+        listen='0.0.0.0',
+        port=PORT,
+        url_path=url_path,
+        webhook_url=f"{WEBHOOK_URL}/{url_path}",
+        drop_pending_updates=drop_pending_updates
+    )
+    # The tornado app only knows the webhook route; add the probes on its own loop
+    app = updater.httpd.http_server.request_callback
+    updater.httpd.loop.add_callback(
+        app.add_handlers,
+        r".*",
+        [(r"/(healthz|readyz|metrics)?", TornadoHealthHandler, {"health": health})]
+    )
+
+
+def coalesce_backlog(updates: list, routes: dict, window: float) -> list:
+    """Drop menu requests that a later request of the same chat supersedes.
+
+    A /start or menu button press is kept only if the chat sent no other such
+    request within ``window`` seconds after it, so five taps on one button or
+    a quick walk through the menu are answered once, with the latest choice.
+    Inline menu taps carry no date of their own, so only the last tap of a
+    chat is kept. Every other update is kept in its original order.
+    """
+    latest = {}
+    tapped = set()
+    superseded = set()
+    for update in reversed(updates):
+        if update.callback_query is not None:
+            sender = update.effective_chat or update.effective_user
+            if sender.id in tapped:
+                superseded.add(update.update_id)
+            tapped.add(sender.id)
+            continue
+        message = update.message
+        if message is None or not (message.text == '/start' or message.text in routes):
+            continue
+        later = latest.get(message.chat_id)
+        if later is not None and (later - message.date).total_seconds() <= window:
+            superseded.add(update.update_id)
+        latest[message.chat_id] = message.date
+    return [update for update in updates if update.update_id not in superseded]
+
+
+class BacklogCatchUp:
+    """Fetch the updates that piled up while the bot was down and queue them coalesced.
+
+    Fetching stops at the first short batch, which marks the end of what
+    piled up, or after ``limit`` updates or ``timeout`` seconds, so live
+    traffic cannot keep it going. The backlog waited out the downtime, so it
+    is left out of the delivery lag statistics.
+    """
+
+    def __init__(self, window: float, stats: DeliveryStats, limit: int = 10000, timeout: float = 10):
+        self.window = window
+        self.stats = stats
+        self.limit = limit
+        self.timeout = timeout
+        self.fetched = 0
+        self.queued = 0
+        self.seconds = 0.0
+
+    def run(self, updater: Updater, pending) -> None:
+        """Drain the backlog into the update queue; report once it has been answered.
+
+        ``pending`` returns how many updates are still queued or being handled;
+        the backlog counts as answered once nothing is.
+        """
+        started = time.monotonic()
+        bot = updater.bot
+        # getUpdates is refused while a webhook is set; start_webhook sets it again
+        bot.delete_webhook()
+        backlog = []
+        offset = 0
+        try:
+            updates = []
+            while len(backlog) < self.limit and time.monotonic() - started < self.timeout:
+                # 100 is the largest batch the Bot API returns
+                updates = bot.get_updates(offset=offset, limit=100, timeout=0)
+                backlog.extend(updates)
+                if updates:
+                    offset = updates[-1].update_id + 1
+                if len(updates) < 100:
+                    break
+            if updates:
+                # Confirm the last batch, or a webhook set next would deliver it again
+                bot.get_updates(offset=offset, limit=1, timeout=0)
+        finally:
+            # Each call confirmed the batches before it; those must be answered even if one failed
+            if offset:
+                updater.last_update_id = offset
+            queued = coalesce_backlog(backlog, CONTENT.current.routes, self.window)
+            self.stats.skip(update.update_id for update in queued)
+            for update in queued:
+                updater.update_queue.put(update)
+            self.fetched = len(backlog)
+            self.queued = len(queued)
+            logger.info(f"Backlog: fetched {self.fetched} updates, answering {self.queued}")
+
+        def report() -> None:
+            while pending():
+                time.sleep(0.1)
+            self.seconds = time.monotonic() - started
+            logger.info(f"Backlog of {self.fetched} updates caught up in {self.seconds:.1f}s")
+
+        threading.Thread(target=report, name="catch-up", daemon=True).start()
+
+
 def main() -> None:
     """Start the bot."""
     try:
@@ -226,21 +615,114 @@ def main() -> None:
             raise ValueError("Bot token not found in environment variables")
 
         # Create the Updater and pass it your bot's token
-        updater = Updater(bot_token)
+        persistence = SqlitePersistence(DB_PATH, flush_interval=DB_FLUSH_INTERVAL)
+        # Bot API calls are timed per method by the request object
+        bot = ExtBot(
+            bot_token,
+            base_url=BOT_API_URL,
+            request=InstrumentedRequest(API_SECONDS, con_pool_size=CON_POOL_SIZE)
+        )
+        updater = Updater(bot=bot, persistence=persistence)
 
         # Get the dispatcher to register handlers
         dispatcher = updater.dispatcher
 
+        # Hand handlers to per-chat ordered workers so one slow reply does not stall other chats
+        executor = ChatOrderedExecutor(DISPATCH_WORKERS, HANDLER_SECONDS) if DISPATCH_WORKERS > 0 else None
+        dispatch = (lambda callback: executor.wrap(timed(callback))) if executor else timed
+
+        # Measure delivery lag before any handler runs
+        stats = DeliveryStats(BOT_MODE)
+        dispatcher.add_handler(TypeHandler(Update, stats.record), group=-1)
+        dispatcher.add_handler(TypeHandler(Update, persistence.record_user), group=-2)
+        dispatcher.add_handler(TypeHandler(Update, count_update), group=-3)
+
         # Add handlers
-        dispatcher.add_handler(CommandHandler("start", start))
-        dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, message_handler))
+        dispatcher.add_handler(CommandHandler("start", dispatch(start)))
+        dispatcher.add_handler(CommandHandler(
+            "broadcast", dispatch(broadcast_command), filters=Filters.user(user_id=ADMIN_IDS)
+        ))
+        dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, dispatch(message_handler)))
+        dispatcher.add_handler(CallbackQueryHandler(dispatch(navigation_handler)))
+        dispatcher.add_handler(InlineQueryHandler(dispatch(inline_query_handler)))
         
         # Add error handler
         dispatcher.add_error_handler(error_handler)
 
+        def queue_depth() -> int:
+            return updater.update_queue.qsize() + (executor.queue_depth() if executor else 0)
+
+        def unfinished() -> int:
+            # The dispatcher marks an update done only after its handlers returned
+            return updater.update_queue.unfinished_tasks + (executor.unfinished() if executor else 0)
+
+        # Without updater.idle() nothing stops the updater or commits buffered writes on shutdown
+        def shutdown(signum, frame):
+            logger.info("Received SIGTERM, answering queued updates")
+            deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+            # stop() also waits out the poller's current long poll; do not block on that
+            threading.Thread(target=updater.stop, name="updater-stop", daemon=True).start()
+            # The dispatcher stops once it has handed every received update to the workers
+            while dispatcher.running and time.monotonic() < deadline:
+                time.sleep(0.05)
+            drained = not dispatcher.running and updater.update_queue.empty() and (
+                executor.join(max(0.0, deadline - time.monotonic())) if executor else True
+            )
+            if not drained:
+                pending = queue_depth()
+                logger.warning(f"Shutting down with {pending} updates unanswered")
+            elif BOT_MODE != 'webhook':
+                # The poller confirms a batch only with its next request; confirm the last one
+                try:
+                    bot.get_updates(offset=updater.last_update_id, limit=1, timeout=0)
+                except TelegramError as e:
+                    logger.error(f"Failed to confirm the last polled updates: {e}")
+            logger.info("Saving data")
+            dispatcher.update_persistence()
+            persistence.flush()
+            os._exit(0)
+        signal.signal(signal.SIGTERM, shutdown)
+
         # Start the bot
-        logger.info("Bot started successfully")
-        updater.start_polling()
+        Gauge(METRICS, 'bot_dispatch_queue_depth', 'Updates waiting to be handled', queue_depth)
+        Gauge(
+            METRICS, 'bot_delivery_lag_seconds',
+            'Mean delay between Telegram accepting an update and the bot receiving it',
+            stats.mean_lag
+        )
+        catch_up = BacklogCatchUp(CATCHUP_WINDOW, stats, CATCHUP_LIMIT, CATCHUP_TIMEOUT)
+        Gauge(METRICS, 'bot_catchup_fetched_updates', 'Backlog updates found at startup',
+              lambda: catch_up.fetched)
+        Gauge(METRICS, 'bot_catchup_queued_updates', 'Backlog updates left after coalescing',
+              lambda: catch_up.queued)
+        Gauge(METRICS, 'bot_catchup_seconds', 'Time from startup until the backlog was answered',
+              lambda: catch_up.seconds)
+        health = HealthCheck(updater, stats, executor, METRICS)
+        if executor:
+            updater.job_queue.run_repeating(
+                lambda context: logger.info(f"Dispatch stats: {executor.summary()}"), interval=60
+            )
+        if CONTENT_RELOAD_INTERVAL > 0:
+            updater.job_queue.run_repeating(
+                lambda context: CONTENT.reload(), interval=CONTENT_RELOAD_INTERVAL
+            )
+        if BOT_MODE != 'webhook':
+            # Polling stays available as a fallback; probes get their own server, up during catch-up
+            run_health_server(health)
+        if CATCHUP_MODE == 'coalesce':
+            try:
+                catch_up.run(updater, unfinished)
+            except TelegramError as e:
+                logger.error(
+                    f"Backlog catch-up failed after {catch_up.fetched} updates, "
+                    f"answering the rest update by update: {e}"
+                )
+        drop_pending_updates = CATCHUP_MODE == 'drop'
+        if BOT_MODE == 'webhook':
+            start_webhook(updater, bot_token, health, drop_pending_updates)
+        else:
+            updater.start_polling(drop_pending_updates=drop_pending_updates)
+        logger.info(f"Bot started successfully in {BOT_MODE} mode")
 
         # I suspect the following function of responding with online casino messages.
         # Anyway, it's excessive because the above start_polling already start the app until it's terminated.
@@ -250,22 +732,5 @@ def main() -> None:
         logger.error(f"Failed to start bot: {e}")
         raise
 
-#class HealthHandler(BaseHTTPRequestHandler):
-#    def do_GET(self):
-#        if self.path == '/':
-#            self.send_response(200)
-#            self.end_headers()
-#            self.wfile.write(b'OK')
-#        else:
-#            self.send_response(404)
-#            self.end_headers()
-
-#def run_health_server():
-#    server = HTTPServer(('0.0.0.0', 8080), HealthHandler)
-#    server.serve_forever()
-
-# No need to run additional healthchecks - Telegram's Updater run them automatically
-#threading.Thread(target=run_health_server, daemon=True).start()
-
 if __name__ == '__main__':
     main() 
\ No newline at end of file
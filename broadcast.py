@@ -0,0 +1,189 @@
+import time
+import logging
+import threading
+from queue import Queue, Empty
+from telegram import Bot, ParseMode
+from telegram.error import TelegramError, RetryAfter, TimedOut, NetworkError, Unauthorized, BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket shared by all outbound senders.
+
+    Telegram allows about 30 messages per second overall and one per second
+    to the same chat. Messages are spaced evenly rather than sent in bursts.
+    ``acquire`` blocks until both limits allow a message, and ``pause``
+    stops every sender after a ``RetryAfter`` flood warning. Replies to
+    users go first through ``take``, which never waits for a token; the
+    bucket goes into debt instead and the next bulk messages wait longer.
+    """
+
+    def __init__(self, rate: float = 30, per_chat_interval: float = 1.0):
+        self.rate = rate
+        self.per_chat_interval = per_chat_interval
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._chat_next = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id: int) -> None:
+        """Block until a message to chat_id may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(
+                    self._paused_until - now,
+                    self._chat_next.get(chat_id, 0.0) - now,
+                    (1 - self._tokens) / self.rate
+                )
+                if wait <= 0:
+                    self._tokens -= 1
+                    self._chat_next[chat_id] = now + self.per_chat_interval
+                    if len(self._chat_next) > 10000:
+                        self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+                    return
+            time.sleep(wait)
+
+    def take(self, chat_id: int) -> None:
+        """Count a message that must not queue behind bulk sends; waits only out a pause."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    self._refill(now)
+                    # Debt is capped at a second's worth so a reply spike cannot starve broadcasts
+                    self._tokens = max(self._tokens - 1, -self.rate)
+                    self._chat_next[chat_id] = max(
+                        self._chat_next.get(chat_id, 0.0), now + self.per_chat_interval
+                    )
+                    return
+            time.sleep(wait)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(1.0, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all senders for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class BroadcastResult:
+    """Counters of a finished broadcast."""
+
+    def __init__(self):
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def __str__(self) -> str:
+        return (
+            f"sent={self.sent} blocked={self.blocked} failed={self.failed} "
+            f"elapsed={self.elapsed:.1f}s"
+        )
+
+
+class Broadcaster:
+    """Push one message to many chats as fast as Telegram's limits allow.
+
+    Messages go out from a few sender threads through a shared RateLimiter.
+    ``RetryAfter`` pauses every sender for the requested time and the message
+    is sent again; timeouts and network errors are retried with exponential
+    backoff; chats that blocked the bot or no longer exist are skipped and
+    reported through ``on_blocked``.
+    """
+
+    def __init__(self, limiter: RateLimiter, workers: int = 4,
+                 max_retries: int = 3, backoff: float = 1.0):
+        self.limiter = limiter
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._running = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        """Whether a broadcast is in progress."""
+        return self._running.locked()
+
+    def broadcast(self, bot: Bot, chat_ids, text: str, on_blocked=None) -> BroadcastResult:
+        """Send a MarkdownV2 text to every chat and wait until all are done."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A broadcast is already running")
+        try:
+            result = BroadcastResult()
+            started = time.monotonic()
+            queue = Queue()
+            for chat_id in chat_ids:
+                queue.put(chat_id)
+            senders = [
+                threading.Thread(
+                    target=self._send_all, args=(bot, queue, text, result, on_blocked),
+                    name=f"broadcast-{number}", daemon=True
+                )
+                for number in range(self.workers)
+            ]
+            for sender in senders:
+                sender.start()
+            for sender in senders:
+                sender.join()
+            result.elapsed = time.monotonic() - started
+            return result
+        finally:
+            self._running.release()
+
+    def _send_all(self, bot: Bot, queue: Queue, text: str, result: BroadcastResult, on_blocked) -> None:
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except Empty:
+                return
+            outcome = self._send(bot, chat_id, text)
+            result.count(outcome)
+            if outcome == 'blocked' and on_blocked:
+                on_blocked(chat_id)
+
+    def _send(self, bot: Bot, chat_id: int, text: str) -> str:
+        """Deliver one message and return 'sent', 'blocked' or 'failed'."""
+        attempt = 0
+        while True:
+            self.limiter.acquire(chat_id)
+            try:
+                bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                    disable_web_page_preview=True
+                )
+                return 'sent'
+            except RetryAfter as e:
+                logger.warning(f"Flood limit hit, pausing broadcast for {e.retry_after}s")
+                self.limiter.pause(e.retry_after)
+            except Unauthorized:
+                return 'blocked'
+            except BadRequest as e:
+                if 'chat not found' in e.message.lower():
+                    return 'blocked'
+                logger.error(f"Broadcast to {chat_id} rejected: {e}")
+                return 'failed'
+            except (TimedOut, NetworkError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Broadcast to {chat_id} failed after {attempt} attempts: {e}")
+                    return 'failed'
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            except TelegramError as e:
+                logger.error(f"Broadcast to {chat_id} failed: {e}")
+                return 'failed'
@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import logging
+import functools
+import threading
+from telegram import (
+    ParseMode,
+    ReplyKeyboardMarkup,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
+
+logger = logging.getLogger(__name__)
+
+# Characters that must be escaped in MarkdownV2 outside of entities
+RESERVED = set('_*[]()~`>#+-=|{}.!')
+# Telegram rejects longer message texts
+MAX_MESSAGE_LENGTH = 4096
+# Callback data of the inline menu itself; sections use their key
+MENU_VIEW = 'menu'
+# Telegram limits callback data to 64 bytes and inline answers to 50 results
+MAX_CALLBACK_DATA = 64
+MAX_INLINE_RESULTS = 50
+# Fragment reference; any other "$" is literal text
+FRAGMENT = re.compile(r'\$\{(\w+)\}')
+# Label of the inline button leading back to the menu, unless the catalog sets its own
+BACK_BUTTON = "⬅️ Назад"
+
+
+def validate_markdown_v2(text: str) -> None:
+    """Raise ValueError if text would be rejected by Telegram's MarkdownV2 parser."""
+    if not text:
+        raise ValueError("text is empty")
+    if len(text.encode('utf-16-le')) // 2 > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"text is longer than {MAX_MESSAGE_LENGTH} characters")
+
+    open_entities = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            if i + 1 >= len(text) or not 1 <= ord(text[i + 1]) <= 126:
+                raise ValueError(f"dangling escape at position {i}")
+            i += 2
+            continue
+        if char == '`':
+            marker = '```' if text.startswith('```', i) else '`'
+            end = _find_unescaped(text, marker, i + len(marker))
+            if end < 0:
+                raise ValueError(f"unclosed code entity at position {i}")
+            i = end + len(marker)
+            continue
+        if char == '[':
+            open_entities.append(('[', i))
+            i += 1
+            continue
+        if char == ']':
+            if not open_entities or open_entities[-1][0] != '[':
+                raise ValueError(f"unexpected ']' at position {i}")
+            open_entities.pop()
+            if not text.startswith('(', i + 1):
+                raise ValueError(f"link without URL at position {i}")
+            end = _find_unescaped(text, ')', i + 2)
+            if end < 0:
+                raise ValueError(f"unclosed link URL at position {i}")
+            i = end + 1
+            continue
+        if char in '*_~|':
+            marker = char
+            if char in '_|' and text.startswith(char * 2, i):
+                marker = char * 2
+            elif char == '|':
+                raise ValueError(f"unescaped '|' at position {i}")
+            if any(entity == marker for entity, _ in open_entities):
+                if open_entities[-1][0] != marker:
+                    raise ValueError(f"improperly nested '{marker}' at position {i}")
+                open_entities.pop()
+            else:
+                open_entities.append((marker, i))
+            i += len(marker)
+            continue
+        if char in RESERVED:
+            raise ValueError(f"unescaped '{char}' at position {i}")
+        i += 1
+
+    if open_entities:
+        entity, position = open_entities[-1]
+        raise ValueError(f"unclosed '{entity}' at position {position}")
+
+
+def _find_unescaped(text: str, marker: str, start: int) -> int:
+    """Return the index of the next unescaped marker, or -1."""
+    i = start
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text.startswith(marker, i):
+            return i
+        i += 1
+    return -1
+
+
+def get_keyboard(buttons):
+    """Create the keyboard with uniform width buttons."""
+    keyboard = [[button] for button in buttons]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+
+def get_inline_keyboard(buttons):
+    """Create an inline keyboard of (text, callback data) buttons, one per row."""
+    keyboard = [[InlineKeyboardButton(text, callback_data=data)] for text, data in buttons]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def plain_text(text: str) -> str:
+    """Strip MarkdownV2 markup, leaving the text a user sees."""
+    # Escaped characters are kept, link URLs and entity markers are dropped
+    return re.sub(r'\\(.)|\]\((?:\\.|[^)\\])*\)|[*_~`|\[\]]', lambda m: m.group(1) or '', text)
+
+
+def build_reply(text: str, reply_markup: str) -> dict:
+    """Build the full set of sendMessage parameters for a MarkdownV2 reply."""
+    return {
+        'text': text,
+        'reply_markup': reply_markup,
+        'parse_mode': ParseMode.MARKDOWN_V2,
+        'disable_web_page_preview': True
+    }
+
+
+class Catalog:
+    """Compiled content: keyboards, the /start reply, the menu router and views.
+
+    Everything a reply needs is built here once, so handlers only look up a
+    ready set of sendMessage or editMessageText parameters. Keyboards are
+    serialized to JSON up front and passed through to the Bot API unchanged.
+    """
+
+    def __init__(self, welcome: str, sections, back_button: str = BACK_BUTTON):
+        self.sections = {key: (button, text) for key, button, text in sections}
+        self.buttons = {button: key for key, button, _ in sections}
+        self.keyboard_markup = get_keyboard(button for _, button, _ in sections).to_json()
+        self.start_reply = build_reply(welcome, self.keyboard_markup)
+        self.routes = {
+            button: build_reply(text, self.keyboard_markup) for _, button, text in sections
+        }
+
+        # Inline navigation: the menu lists every section, a section links to the others
+        menu_markup = get_inline_keyboard((button, key) for key, button, _ in sections).to_json()
+        self.inline_start_reply = build_reply(welcome, menu_markup)
+        self.views = {MENU_VIEW: build_reply(welcome, menu_markup)}
+        for key, _, text in sections:
+            buttons = [(button, other) for other, button, _ in sections if other != key]
+            markup = get_inline_keyboard(buttons + [(back_button, MENU_VIEW)]).to_json()
+            self.views[key] = build_reply(text, markup)
+
+        # Inline queries: search terms and ready results per section
+        self._terms = {}
+        self._results = {}
+        for key, button, text in sections:
+            visible = plain_text(text)
+            self._terms[key] = set(re.findall(r'\w+', f"{button} {visible}".lower()))
+            self._results[key] = InlineQueryResultArticle(
+                id=key,
+                title=button,
+                description=visible.split('\n', 1)[0],
+                input_message_content=InputTextMessageContent(
+                    text, parse_mode=ParseMode.MARKDOWN_V2, disable_web_page_preview=True
+                )
+            )
+        # Words found in every section (the shared footer) would match everything
+        if len(self._terms) > 1:
+            common = set.intersection(*self._terms.values())
+            for terms in self._terms.values():
+                terms -= common
+        self.search = functools.lru_cache(maxsize=1024)(self._search)
+
+    def text(self, key: str) -> str:
+        """Return the text of a section."""
+        return self.sections[key][1]
+
+    def _search(self, query: str) -> tuple:
+        """Return the inline results of sections matching every word of the query by prefix."""
+        words = re.findall(r'\w+', query.lower())
+        return tuple(
+            result for key, result in self._results.items()
+            if all(any(term.startswith(word) for term in self._terms[key]) for word in words)
+        )[:MAX_INLINE_RESULTS]
+
+
+def _join(value) -> str:
+    """Texts may be written as a list of lines."""
+    return "\n".join(value) if isinstance(value, list) else value
+
+
+def load_catalog(path: str) -> Catalog:
+    """Load, expand and validate a content catalog file.
+
+    Fragments are substituted with ``${name}`` and may refer to fragments
+    defined before them. Every resulting text is checked against MarkdownV2,
+    so a broken entry fails here instead of at send time.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+
+    fragments = {}
+    for name, value in data.get('fragments', {}).items():
+        fragments[name] = _expand(_join(value), fragments, f"fragment '{name}'")
+
+    welcome = _expand(_join(data['welcome']), fragments, "welcome")
+    _validate(welcome, "welcome")
+
+    sections = []
+    seen = set()
+    for section in data['sections']:
+        key, button = section['key'], section['button']
+        if key in seen or button in (b for _, b, _ in sections):
+            raise ValueError(f"duplicate section '{key}' / '{button}' in {path}")
+        if key == MENU_VIEW or len(key.encode('utf-8')) > MAX_CALLBACK_DATA:
+            raise ValueError(f"section key '{key}' is reserved or too long in {path}")
+        seen.add(key)
+        text = _expand(_join(section['text']), fragments, f"section '{key}'")
+        _validate(text, f"section '{key}'")
+        sections.append((key, button, text))
+    if not sections:
+        raise ValueError(f"no sections in {path}")
+
+    return Catalog(welcome, sections, data.get('back_button', BACK_BUTTON))
+
+
+def _expand(text: str, fragments: dict, where: str) -> str:
+    def fragment(match) -> str:
+        name = match.group(1)
+        if name not in fragments:
+            raise ValueError(f"unknown fragment '{name}' in {where}")
+        return fragments[name]
+    return FRAGMENT.sub(fragment, text)
+
+
+def _validate(text: str, where: str) -> None:
+    try:
+        validate_markdown_v2(text)
+    except ValueError as e:
+        raise ValueError(f"invalid MarkdownV2 in {where}: {e}") from e
+
+
+class CatalogStore:
+    """Hold the current catalog and swap in a new one when the file changes.
+
+    A new catalog is fully loaded and validated before it replaces the old
+    one with a single reference assignment, so handlers running during a
+    reload see either the old or the new content, never a mix, and an
+    invalid file leaves the running content untouched.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime_ns
+        self.current = load_catalog(path)
+
+    def reload(self) -> bool:
+        """Reload the catalog if the file changed; return True if it was swapped."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                logger.error(f"Catalog {self.path} unavailable, keeping current content: {e}")
+                return False
+            if mtime == self._mtime:
+                return False
+            # Remember the version even if it is rejected, so it is reported once
+            self._mtime = mtime
+            try:
+                catalog = load_catalog(self.path)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.error(f"Catalog {self.path} rejected, keeping current content: {e}")
+                return False
+            self.current = catalog
+        logger.info(f"Catalog {self.path} reloaded")
+        return True
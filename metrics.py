@@ -0,0 +1,154 @@
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from telegram.utils.request import Request
+
+# Latency buckets in seconds, from fast local handlers to slow Bot API calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(label: str, value) -> str:
+    if label is None:
+        return ""
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{label}="{escaped}"'
+
+
+class Registry:
+    """Collection of metrics rendered together in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+    """Monotonic counter, optionally split by a single label."""
+
+    kind = 'counter'
+
+    def __init__(self, registry: Registry, name: str, help: str, label: str = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, value=None, amount: float = 1) -> None:
+        with self._lock:
+            self._values[value] = self._values.get(value, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for value, count in values:
+            labels = _labels(self.label, value)
+            yield f"{self.name}{{{labels}}} {count}" if labels else f"{self.name} {count}"
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, optionally split by a single label."""
+
+    kind = 'histogram'
+
+    def __init__(self, registry: Registry, name: str, help: str, label: str = None,
+                 buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, seconds: float, value=None) -> None:
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._values.get(value)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), then the sum
+                series = self._values[value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def totals(self) -> dict:
+        """Return the count and sum of observations per label value."""
+        with self._lock:
+            return {value: (sum(series[:-1]), series[-1]) for value, series in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = [(value, list(series)) for value, series in self._values.items()]
+        for value, series in values:
+            labels = _labels(self.label, value)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+            suffix = f"{{{labels}}}" if labels else ""
+            yield f"{self.name}_sum{suffix} {series[-1]}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time, so updating it costs nothing."""
+
+    kind = 'gauge'
+
+    def __init__(self, registry: Registry, name: str, help: str, read=None):
+        self.name = name
+        self.help = help
+        self.read = read
+        registry.register(self)
+
+    def samples(self):
+        if self.read is not None:
+            yield f"{self.name} {self.read()}"
+
+
+class Throughput:
+    """Rate of events over a sliding window."""
+
+    def __init__(self, window: float = 10.0, limit: int = 100000):
+        self.window = window
+        self._times = deque(maxlen=limit)
+
+    def mark(self) -> None:
+        self._times.append(time.monotonic())
+
+    def rate(self) -> float:
+        since = time.monotonic() - self.window
+        times = list(self._times)
+        recent = len(times) - bisect_left(times, since)
+        return recent / self.window
+
+
+class InstrumentedRequest(Request):
+    """Bot API connection that records the duration of every call by method."""
+
+    __slots__ = ('histogram',)
+
+    def __init__(self, histogram: Histogram, **kwargs):
+        super().__init__(**kwargs)
+        self.histogram = histogram
+
+    def post(self, url: str, data, timeout: float = None):
+        started = time.perf_counter()
+        try:
+            return super().post(url, data, timeout=timeout)
+        finally:
+            self.histogram.observe(time.perf_counter() - started, url.rsplit('/', 1)[-1])
@@ -0,0 +1,250 @@
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import defaultdict
+from telegram import Update
+from telegram.ext import BasePersistence, CallbackContext
+
+logger = logging.getLogger(__name__)
+
+EMPTY = pickle.dumps({})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    private INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    data BLOB
+);
+CREATE INDEX IF NOT EXISTS users_with_data ON users(user_id) WHERE data IS NOT NULL;
+CREATE INDEX IF NOT EXISTS users_reachable ON users(user_id) WHERE private = 1 AND blocked = 0;
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bot_data (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key BLOB NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+
+class SqlitePersistence(BasePersistence):
+    """Persist users, their last activity and PTB data in SQLite.
+
+    Handlers never touch the disk: updates are collected in memory, where
+    repeated writes of the same row collapse into the latest one, and a
+    background thread commits them in one transaction every
+    ``flush_interval`` seconds. The database runs in WAL mode, so reads
+    from other connections are not blocked by the writer.
+
+    Only users that actually have ``user_data`` are loaded at startup, so
+    a large user table does not slow it down.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        super().__init__(store_user_data=True, store_chat_data=True, store_bot_data=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._touched = {}
+        self._blocked = set()
+        # Data blobs as stored in the database, and queued ones not written yet
+        self._saved = {}
+        self._queued = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._db = self._connect()
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+        self._writer = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _load(self, table: str, query: str) -> dict:
+        """Read key -> unpickled data rows, remembering what is stored."""
+        data = {}
+        for key, blob in self._db.execute(query):
+            data[key] = pickle.loads(blob)
+            self._saved[table, key] = blob
+        return data
+
+    # BasePersistence interface
+
+    def get_user_data(self):
+        rows = self._load('users', "SELECT user_id, data FROM users WHERE data IS NOT NULL")
+        return defaultdict(dict, rows)
+
+    def get_chat_data(self):
+        return defaultdict(dict, self._load('chats', "SELECT chat_id, data FROM chats"))
+
+    def get_bot_data(self):
+        return self._load('bot_data', "SELECT id, data FROM bot_data").get(0, {})
+
+    def get_conversations(self, name: str):
+        rows = self._db.execute("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {pickle.loads(key): pickle.loads(state) for key, state in rows}
+
+    def update_conversation(self, name: str, key, new_state) -> None:
+        self._queue(
+            ('conversations', name, key),
+            "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+            "ON CONFLICT(name, key) DO UPDATE SET state = excluded.state",
+            (name, pickle.dumps(key), pickle.dumps(new_state))
+        )
+
+    def update_user_data(self, user_id: int, data: dict) -> None:
+        self._queue_data(
+            'users', user_id, data,
+            "INSERT INTO users (user_id, first_seen, last_seen, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+            lambda blob: (user_id, time.time(), time.time(), blob)
+        )
+
+    def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._queue_data(
+            'chats', chat_id, data,
+            "INSERT INTO chats (chat_id, data) VALUES (?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data",
+            lambda blob: (chat_id, blob)
+        )
+
+    def update_bot_data(self, data: dict) -> None:
+        self._queue_data(
+            'bot_data', 0, data,
+            "INSERT INTO bot_data (id, data) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            lambda blob: (0, blob)
+        )
+
+    def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    def flush(self) -> None:
+        """Commit everything still buffered; called on shutdown."""
+        self._stop.set()
+        self._commit()
+
+    # Users
+
+    def record_user(self, update: Update, context: CallbackContext) -> None:
+        """Remember the user of an incoming update and when they were last active."""
+        user = update.effective_user
+        if user is None:
+            return
+        chat = update.effective_chat
+        private = 1 if chat is not None and chat.type == 'private' else 0
+        with self._lock:
+            previous = self._touched.get(user.id)
+            self._touched[user.id] = (max(private, previous[0]) if previous else private, time.time())
+            self._blocked.discard(user.id)
+
+    def mark_blocked(self, user_id: int) -> None:
+        """Exclude a user who blocked the bot from broadcasts."""
+        with self._lock:
+            self._blocked.add(user_id)
+
+    def chat_ids(self) -> list:
+        """Return the private chats of all users that can receive broadcasts."""
+        self._commit()
+        db = self._connect()
+        try:
+            return [
+                user_id for user_id, in
+                db.execute("SELECT user_id FROM users WHERE private = 1 AND blocked = 0")
+            ]
+        finally:
+            db.close()
+
+    # Write buffer
+
+    def _queue(self, key, statement: str, params: tuple) -> None:
+        with self._lock:
+            self._pending[key] = (statement, params)
+
+    def _queue_data(self, table: str, key, data: dict, statement: str, params) -> None:
+        """Queue a data row unless it is unchanged since it was last queued."""
+        blob = pickle.dumps(data)
+        with self._lock:
+            if self._queued.get((table, key), self._saved.get((table, key), EMPTY)) == blob:
+                return
+            self._queued[table, key] = blob
+            self._pending[table, key] = (statement, params(blob))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write persistence batch, will retry: {e}")
+
+    def _commit(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                touched, self._touched = self._touched, {}
+                blocked, self._blocked = self._blocked, set()
+                written = {key: self._queued[key] for key in pending if key in self._queued}
+            if not (pending or touched or blocked):
+                return
+            try:
+                self._write(pending, touched, blocked)
+            except sqlite3.Error:
+                self._requeue(pending, touched, blocked)
+                raise
+            with self._lock:
+                for key, blob in written.items():
+                    self._saved[key] = blob
+                    # Unless the row changed again while the batch was written
+                    if self._queued.get(key) is blob:
+                        del self._queued[key]
+
+    def _write(self, pending: dict, touched: dict, blocked: set) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO users (user_id, first_seen, last_seen, private) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen, "
+                "private = max(private, excluded.private), blocked = 0",
+                [(user_id, seen, seen, private) for user_id, (private, seen) in touched.items()]
+            )
+            self._db.executemany(
+                "UPDATE users SET blocked = 1 WHERE user_id = ?",
+                [(user_id,) for user_id in blocked]
+            )
+            for statement, params in pending.values():
+                self._db.execute(statement, params)
+
+    def _requeue(self, pending: dict, touched: dict, blocked: set) -> None:
+        """Put a batch that failed to commit back, under anything queued since."""
+        with self._lock:
+            for key, value in pending.items():
+                self._pending.setdefault(key, value)
+            # Activity after the failed batch means the user did not block the bot
+            self._blocked |= blocked - self._touched.keys()
+            for user_id, (private, seen) in touched.items():
+                newer = self._touched.get(user_id)
+                self._touched[user_id] = (max(private, newer[0]), newer[1]) if newer else (private, seen)
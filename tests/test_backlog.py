@@ -0,0 +1,171 @@
+from queue import Queue
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update
+from telegram.error import NetworkError
+
+from bot import BacklogCatchUp, DeliveryStats, coalesce_backlog
+
+ROUTES = {"📅 Мероприятия": {}, "📞 Контакты": {}}
+WINDOW = 60
+
+
+def message(update_id: int, chat_id: int, date: int, text: str) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': date,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': "user"},
+            'text': text,
+        },
+    }, None)
+
+
+def tap(update_id: int, chat_id: int, data: str) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': "user"},
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': 1000,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': "меню",
+            },
+        },
+    }, None)
+
+
+def kept(updates) -> list:
+    return [update.update_id for update in coalesce_backlog(updates, ROUTES, WINDOW)]
+
+
+def test_repeated_presses_are_answered_once():
+    updates = [message(n, 1, 1000 + n, "📅 Мероприятия") for n in range(1, 6)]
+    assert kept(updates) == [5]
+
+
+def test_only_the_latest_menu_request_within_the_window_is_kept():
+    updates = [
+        message(1, 1, 1000, "/start"),
+        message(2, 1, 1010, "📅 Мероприятия"),
+        message(3, 1, 1020, "📞 Контакты"),
+    ]
+    assert kept(updates) == [3]
+
+
+def test_presses_further_apart_than_the_window_are_kept():
+    updates = [
+        message(1, 1, 1000, "📅 Мероприятия"),
+        message(2, 1, 1000 + WINDOW + 1, "📞 Контакты"),
+        message(3, 1, 1000 + 2 * WINDOW + 1, "📅 Мероприятия"),
+    ]
+    # The window is inclusive: 2 is exactly WINDOW seconds before 3
+    assert kept(updates) == [1, 3]
+
+
+def test_chats_are_coalesced_separately():
+    updates = [
+        message(1, 1, 1000, "📅 Мероприятия"),
+        message(2, 2, 1001, "📅 Мероприятия"),
+        message(3, 1, 1002, "📞 Контакты"),
+        message(4, 2, 1003, "/start"),
+    ]
+    assert kept(updates) == [3, 4]
+
+
+def test_other_updates_are_kept_in_order():
+    updates = [
+        message(1, 1, 1000, "вопрос организаторам"),
+        message(2, 1, 1001, "📅 Мероприятия"),
+        message(3, 1, 1002, "/broadcast анонс"),
+        message(4, 1, 1003, "📞 Контакты"),
+        message(5, 1, 1004, "ещё вопрос"),
+    ]
+    assert kept(updates) == [1, 3, 4, 5]
+
+
+def test_only_the_last_inline_tap_of_a_chat_is_kept():
+    updates = [
+        tap(1, 1, "events"),
+        tap(2, 2, "events"),
+        tap(3, 1, "contacts"),
+        tap(4, 1, "menu"),
+    ]
+    assert kept(updates) == [2, 4]
+
+
+def test_inline_taps_and_messages_are_coalesced_separately():
+    updates = [
+        message(1, 1, 1000, "📅 Мероприятия"),
+        tap(2, 1, "events"),
+        message(3, 1, 1001, "📞 Контакты"),
+        tap(4, 1, "contacts"),
+    ]
+    assert kept(updates) == [3, 4]
+
+
+def test_empty_backlog():
+    assert coalesce_backlog([], ROUTES, WINDOW) == []
+
+
+class FakeBot:
+    """getUpdates over a fixed backlog; ``live`` keeps adding updates as they are fetched."""
+
+    def __init__(self, count: int, live: bool = False, fail_on_call: int = None):
+        self.updates = [message(n, n, 1000 + n, f"вопрос {n}") for n in range(1, count + 1)]
+        self.live = live
+        self.fail_on_call = fail_on_call
+        self.calls = []
+
+    def delete_webhook(self):
+        return True
+
+    def get_updates(self, offset, limit, timeout):
+        self.calls.append(offset)
+        if len(self.calls) == self.fail_on_call:
+            raise NetworkError("connection reset")
+        batch = [update for update in self.updates if update.update_id >= offset][:limit]
+        if self.live:
+            last = self.updates[-1].update_id
+            self.updates += [message(n, n, 1000 + n, "ещё") for n in range(last + 1, last + 101)]
+        return batch
+
+
+def catch_up(bot, **kwargs):
+    updater = SimpleNamespace(bot=bot, update_queue=Queue(), last_update_id=0)
+    run = BacklogCatchUp(WINDOW, DeliveryStats('polling'), **kwargs)
+    return run, updater
+
+
+def test_catch_up_stops_at_a_short_batch_and_confirms_it():
+    bot = FakeBot(250)
+    run, updater = catch_up(bot)
+    run.run(updater, lambda: 0)
+    assert run.fetched == 250 and updater.update_queue.qsize() == 250
+    # Three batches, then one call confirming the last of them
+    assert bot.calls == [0, 101, 201, 251]
+    assert updater.last_update_id == 251
+
+
+def test_catch_up_is_capped_while_live_traffic_keeps_coming():
+    bot = FakeBot(100, live=True)
+    run, updater = catch_up(bot, limit=300)
+    run.run(updater, lambda: 0)
+    assert run.fetched == 300
+    assert updater.last_update_id == 301
+
+
+def test_catch_up_answers_the_fetched_batches_when_a_call_fails():
+    bot = FakeBot(250, fail_on_call=3)
+    run, updater = catch_up(bot)
+    with pytest.raises(NetworkError):
+        run.run(updater, lambda: 0)
+    assert updater.update_queue.qsize() == 200
+    assert updater.last_update_id == 201
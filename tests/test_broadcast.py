@@ -0,0 +1,95 @@
+import threading
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, Unauthorized
+
+from broadcast import Broadcaster, RateLimiter
+
+
+class FakeBot:
+    """Records when each chat was sent to; ``failures`` maps a chat to errors raised in turn."""
+
+    def __init__(self, failures: dict = None):
+        self.failures = failures or {}
+        self.sent = []
+        self.attempts = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            self.attempts.append((chat_id, time.monotonic()))
+            errors = self.failures.get(chat_id)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append((chat_id, time.monotonic()))
+
+
+def test_global_rate_spaces_messages_evenly():
+    limiter = RateLimiter(rate=50, per_chat_interval=0)
+    bot = FakeBot()
+    result = Broadcaster(limiter, workers=4).broadcast(bot, range(26), "анонс")
+    assert result.sent == 26
+    times = sorted(sent for _, sent in bot.sent)
+    # 25 gaps of 1/50 s; no bursts even with four senders
+    assert times[-1] - times[0] >= 0.45
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.015
+
+
+def test_per_chat_interval():
+    limiter = RateLimiter(rate=1000, per_chat_interval=0.2)
+    started = time.monotonic()
+    limiter.acquire(1)
+    limiter.acquire(2)
+    assert time.monotonic() - started < 0.1
+    limiter.acquire(1)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_replies_go_ahead_and_slow_bulk_sends_down():
+    limiter = RateLimiter(rate=20, per_chat_interval=0)
+    started = time.monotonic()
+    for chat_id in range(5):
+        limiter.take(chat_id)
+    assert time.monotonic() - started < 0.05
+    # Five replies of debt plus the one token for this message
+    limiter.acquire(100)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_retry_after_pauses_every_sender():
+    limiter = RateLimiter(rate=1000, per_chat_interval=0)
+    bot = FakeBot({0: [RetryAfter(1)]})
+    result = Broadcaster(limiter, workers=4).broadcast(bot, range(20), "анонс")
+    assert result.sent == 20 and result.failed == 0
+    flood = next(at for chat_id, at in bot.attempts if chat_id == 0)
+    # Senders that already held a token finish at once; then nothing goes out until the pause ends
+    assert not [sent for _, sent in bot.sent if flood + 0.05 < sent < flood + 1]
+    assert max(sent for chat_id, sent in bot.sent if chat_id == 0) >= flood + 1
+
+
+def test_blocked_chats_are_reported():
+    limiter = RateLimiter(rate=1000, per_chat_interval=0)
+    bot = FakeBot({
+        1: [Unauthorized("Forbidden: bot was blocked by the user")],
+        2: [BadRequest("Chat not found")],
+        3: [BadRequest("Message text is empty")],
+    })
+    blocked = []
+    result = Broadcaster(limiter, workers=2).broadcast(bot, [1, 2, 3, 4], "анонс", blocked.append)
+    assert (result.sent, result.blocked, result.failed) == (1, 2, 1)
+    assert sorted(blocked) == [1, 2]
+
+
+def test_network_errors_are_retried_with_backoff():
+    limiter = RateLimiter(rate=1000, per_chat_interval=0)
+    bot = FakeBot({1: [NetworkError("reset"), NetworkError("reset")], 2: [NetworkError("reset")] * 4})
+    broadcaster = Broadcaster(limiter, workers=1, max_retries=3, backoff=0.05)
+    result = broadcaster.broadcast(bot, [1, 2], "анонс")
+    assert (result.sent, result.failed) == (1, 1)
+
+    first = [at for chat_id, at in bot.attempts if chat_id == 1]
+    gaps = [b - a for a, b in zip(first, first[1:])]
+    assert len(first) == 3
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1
+    # The first attempt and three retries
+    assert len([chat_id for chat_id, _ in bot.attempts if chat_id == 2]) == 4
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from catalog import MAX_MESSAGE_LENGTH, CatalogStore, load_catalog, validate_markdown_v2
+
+
+@pytest.mark.parametrize('text', [
+    "Привет\\!",
+    "1\\.5 \\- 2\\.0 \\(примерно\\)",
+    "*жирный* _курсив_ __подчёркнутый__ ~зачёркнутый~ ||спойлер||",
+    "*жирный _курсив внутри_ снова жирный*",
+    "[сайт](https://example.com/path_with_underscores)",
+    "[*жирная ссылка*](https://example.com/a\\)b)",
+    "`код с * и _ внутри`",
+    "```\nблок кода [без] разметки\n```",
+    "`экранированная \\` кавычка`",
+    "цена 100$",
+])
+def test_accepts_valid_markdown(text):
+    validate_markdown_v2(text)
+
+
+@pytest.mark.parametrize('text, error', [
+    ("", "empty"),
+    ("Привет!", "unescaped '!'"),
+    ("1.5", "unescaped '.'"),
+    ("обрыв \\", "dangling escape"),
+    ("*не закрыт", "unclosed '*'"),
+    ("*жирный _курсив* конец_", "improperly nested '*'"),
+    ("[ссылка без адреса]", "link without URL"),
+    ("[ссылка](https://example.com", "unclosed link URL"),
+    ("лишняя ]", "unexpected ']'"),
+    ("`код без конца", "unclosed code entity"),
+    ("```\nблок без конца", "unclosed code entity"),
+    ("один |", "unescaped '|'"),
+])
+def test_rejects_invalid_markdown(text, error):
+    with pytest.raises(ValueError, match=error):
+        validate_markdown_v2(text)
+
+
+def test_length_limit_counts_utf16_units():
+    validate_markdown_v2("а" * MAX_MESSAGE_LENGTH)
+    with pytest.raises(ValueError, match="longer than"):
+        validate_markdown_v2("а" * (MAX_MESSAGE_LENGTH + 1))
+    # Emoji outside the BMP take two UTF-16 code units
+    with pytest.raises(ValueError, match="longer than"):
+        validate_markdown_v2("😀" * (MAX_MESSAGE_LENGTH // 2 + 1))
+
+
+def write_catalog(tmp_path, **data):
+    path = tmp_path / 'content.json'
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_fragments_are_expanded_and_dollar_is_literal(tmp_path):
+    path = write_catalog(
+        tmp_path,
+        fragments={'price': "100$", 'footer': ["—", "Билет: ${price}"]},
+        welcome="Привет",
+        sections=[{'key': 'a', 'button': "A", 'text': "Текст $5\n${footer}"}],
+    )
+    assert load_catalog(path).text('a') == "Текст $5\n—\nБилет: 100$"
+
+
+def test_unknown_fragment_is_rejected(tmp_path):
+    path = write_catalog(
+        tmp_path, welcome="Привет", sections=[{'key': 'a', 'button': "A", 'text': "${missing}"}]
+    )
+    with pytest.raises(ValueError, match="unknown fragment 'missing'"):
+        load_catalog(path)
+
+
+def test_invalid_section_is_rejected(tmp_path):
+    path = write_catalog(
+        tmp_path, welcome="Привет", sections=[{'key': 'a', 'button': "A", 'text': "Ошибка!"}]
+    )
+    with pytest.raises(ValueError, match="section 'a'"):
+        load_catalog(path)
+
+
+def test_catalog_must_be_an_object(tmp_path):
+    path = tmp_path / 'content.json'
+    path.write_text('["welcome"]', encoding='utf-8')
+    with pytest.raises(ValueError, match="JSON object"):
+        load_catalog(str(path))
+
+
+def test_rejected_reload_keeps_the_current_catalog(tmp_path):
+    path = write_catalog(tmp_path, welcome="Привет", sections=[{'key': 'a', 'button': "A", 'text': "Текст"}])
+    store = CatalogStore(path)
+    catalog = store.current
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('["не каталог"]')
+    os.utime(path, ns=(0, store._mtime + 1))
+
+    assert not store.reload()
+    assert store.current is catalog
@@ -0,0 +1,33 @@
+import time
+
+from telegram import Update
+
+from bot import DeliveryStats
+
+CHAT = {'id': 1, 'type': 'private'}
+USER = {'id': 1, 'is_bot': False, 'first_name': "user"}
+
+
+def update(**fields) -> Update:
+    return Update.de_json({'update_id': 1, **fields}, None)
+
+
+def test_only_new_messages_are_sampled():
+    now = int(time.time())
+    stats = DeliveryStats('polling')
+    hour_old = {'message_id': 1, 'date': now - 3600, 'chat': CHAT, 'text': "меню"}
+    stats.record(update(callback_query={
+        'id': '1', 'from': USER, 'chat_instance': '1', 'data': 'menu', 'message': hour_old
+    }), None)
+    stats.record(update(edited_message={**hour_old, 'edit_date': now}), None)
+    assert stats.summary() == "mode=polling samples=0"
+
+    stats.record(update(message={**hour_old, 'date': now}), None)
+    assert stats.mean_lag() < 60
+
+
+def test_skipped_updates_are_not_sampled():
+    stats = DeliveryStats('polling')
+    stats.skip([1])
+    stats.record(update(message={'message_id': 1, 'date': 0, 'chat': CHAT, 'text': "/start"}), None)
+    assert stats.summary() == "mode=polling samples=0"
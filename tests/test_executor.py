@@ -0,0 +1,103 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from bot import ChatOrderedExecutor
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.errors = []
+
+    def update_persistence(self, update):
+        pass
+
+    def dispatch_error(self, update, error):
+        self.errors.append((update.number, error))
+
+
+def update(chat_id: int, number: int = 0, **fields):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None,
+                           number=number, **fields)
+
+
+def run(executor, handler, updates):
+    context = SimpleNamespace(dispatcher=FakeDispatcher())
+    submit = executor.wrap(handler)
+    for item in updates:
+        submit(item, context)
+    return context.dispatcher
+
+
+def test_updates_of_a_chat_are_handled_in_order():
+    handled = []
+
+    def handler(update, context):
+        # Random-ish delays would reorder the updates if two workers shared a chat
+        time.sleep(0.001 * (update.number % 3))
+        handled.append((update.effective_chat.id, update.number))
+
+    executor = ChatOrderedExecutor(4)
+    run(executor, handler, [update(number % 3, number) for number in range(60)])
+    assert executor.join(5)
+    for chat_id in range(3):
+        numbers = [number for chat, number in handled if chat == chat_id]
+        assert numbers == sorted(numbers) and len(numbers) == 20
+
+
+def test_slow_chat_does_not_delay_others():
+    release = threading.Event()
+    handled = []
+
+    def handler(update, context):
+        if update.slow:
+            release.wait(5)
+        handled.append(update.effective_chat.id)
+
+    executor = ChatOrderedExecutor(2)
+    # With chats pinned by id modulo the pool size, every even chat would wait behind chat 0
+    updates = [update(0, slow=True)] + [update(chat_id, slow=False) for chat_id in range(2, 40, 2)]
+    run(executor, handler, updates)
+    deadline = time.monotonic() + 2
+    while len(handled) < 19 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(handled) == list(range(2, 40, 2))
+
+    assert executor.unfinished() == 1
+    release.set()
+    assert executor.join(5)
+
+
+def test_join_and_unfinished_count_waiting_and_running_updates():
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(update, context):
+        started.set()
+        release.wait(5)
+
+    executor = ChatOrderedExecutor(1)
+    run(executor, handler, [update(1, 1), update(1, 2), update(2, 3)])
+    assert started.wait(5)
+    assert executor.queue_depth() == 2
+    assert executor.unfinished() == 3
+    assert not executor.join(0.05)
+
+    release.set()
+    assert executor.join(5)
+    assert executor.unfinished() == 0 and executor.queue_depth() == 0
+
+
+def test_handler_errors_are_dispatched_and_the_worker_survives():
+    handled = []
+
+    def handler(update, context):
+        if update.number == 1:
+            raise ValueError("broken handler")
+        handled.append(update.number)
+
+    executor = ChatOrderedExecutor(1)
+    dispatcher = run(executor, handler, [update(1, 1), update(1, 2), update(2, 3)])
+    assert executor.join(5)
+    assert sorted(handled) == [2, 3]
+    assert [(number, str(error)) for number, error in dispatcher.errors] == [(1, "broken handler")]
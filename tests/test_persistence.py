@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from persistence import SqlitePersistence
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    # Flushed by hand; the writer thread never wakes up during a test
+    return SqlitePersistence(str(tmp_path / 'bot.sqlite3'), flush_interval=3600)
+
+
+def stored_user_data(persistence):
+    return dict(SqlitePersistence(persistence.path).get_user_data())
+
+
+def fail_once(persistence, monkeypatch):
+    write = persistence._write
+
+    def broken(*args):
+        monkeypatch.setattr(persistence, '_write', write)
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(persistence, '_write', broken)
+
+
+def test_failed_batch_is_written_by_the_next_commit(persistence, monkeypatch):
+    persistence.update_user_data(1, {'step': 1})
+    fail_once(persistence, monkeypatch)
+    with pytest.raises(sqlite3.OperationalError):
+        persistence._commit()
+    assert stored_user_data(persistence) == {}
+
+    persistence._commit()
+    assert stored_user_data(persistence) == {1: {'step': 1}}
+
+
+def test_newer_data_wins_over_a_failed_batch(persistence, monkeypatch):
+    persistence.update_user_data(1, {'step': 1})
+    fail_once(persistence, monkeypatch)
+    with pytest.raises(sqlite3.OperationalError):
+        persistence._commit()
+    persistence.update_user_data(1, {'step': 2})
+
+    persistence._commit()
+    assert stored_user_data(persistence) == {1: {'step': 2}}
+
+
+def test_unchanged_data_is_not_queued_again(persistence):
+    persistence.update_user_data(1, {'step': 1})
+    persistence._commit()
+    persistence.update_user_data(1, {'step': 1})
+    assert not persistence._pending
+
+
+def test_reverting_data_before_a_commit_is_written(persistence):
+    persistence.update_user_data(1, {'step': 1})
+    persistence._commit()
+    persistence.update_user_data(1, {'step': 2})
+    persistence.update_user_data(1, {'step': 1})
+
+    persistence._commit()
+    assert stored_user_data(persistence) == {1: {'step': 1}}